@@ -0,0 +1,442 @@
+"""
+司機 GPS 位置收集
+    - 依司機暫存定位點，每隔幾秒以 COPY 批次寫入 driver_locations
+    - 與上一個保留點距離過近且時間過短的點直接丟棄（停車時的重複回報）
+    - driver_latest_locations 每位司機一列最新位置，派車地圖直接讀這張表
+    - 歷史軌跡以 Douglas-Peucker 簡化（compress_history），只保留形狀需要的點
+    - driver_locations / driver_latest_locations 建立 point(longitude, latitude) 的 GiST 索引，可做最近司機查詢
+    - 時間一律存成 UTC（與 Prisma / fleet-service.ts 相同），不帶時區
+    - 資料有問題的司機（例如 driverId 不存在違反外鍵）逐司機重寫後移到 dead_letter，不會卡住其他司機
+用法：
+    ingestor = DriverLocationIngestor(pool).attach(app)
+    ingestor.add({"driverId": ..., "latitude": ..., "longitude": ...})
+    python driver_location_ingest.py compress --older-than 1 --tolerance 10
+"""
+import asyncio
+import logging
+import math
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import asyncpg
+    # 重試也不會成功的錯誤（外鍵、型別、約束），只能把該司機的資料移到 dead_letter
+    DATA_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+except ImportError:
+    DATA_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371000.0
+
+_COLUMNS = ["id", "driverId", "latitude", "longitude", "accuracy", "speed", "heading", "address", "note", "createdAt"]
+
+
+def _utc_naive(value) -> datetime:
+    """轉成不帶時區的 UTC 時間；字串或 datetime 沒有時區時視為 UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """兩點距離（公尺）"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def simplify_track(points: List[Tuple[float, float]], tolerance: float) -> List[int]:
+    """
+    Douglas-Peucker 簡化，回傳要保留的點索引（遞增）。
+    points 為 (lat, lng)；以軌跡第一點為原點投影成公尺平面計算垂直距離，tolerance 單位為公尺。
+    """
+    count = len(points)
+    if count <= 2:
+        return list(range(count))
+
+    lat0 = math.radians(points[0][0])
+    scale_x = EARTH_RADIUS * math.cos(lat0) * math.pi / 180
+    scale_y = EARTH_RADIUS * math.pi / 180
+    xy = [((lng - points[0][1]) * scale_x, (lat - points[0][0]) * scale_y) for lat, lng in points]
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        (x1, y1), (x2, y2) = xy[start], xy[end]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        farthest, index = -1.0, -1
+        for i in range(start + 1, end):
+            px, py = xy[i]
+            if length == 0:
+                distance = math.hypot(px - x1, py - y1)
+            else:
+                distance = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length
+            if distance > farthest:
+                farthest, index = distance, i
+        if farthest > tolerance:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+class DriverLocationIngestor:
+    """司機定位點緩衝寫入"""
+
+    def __init__(self, pool, flush_interval: float = 3.0, min_distance: float = 15.0,
+                 min_interval: float = 60.0, max_pending: int = 10000, reject_ttl: float = 300.0):
+        self.pool = pool  # line_bot_db_pool.LineBotPool 或相容的 asyncpg 連線池包裝
+        self.flush_interval = flush_interval
+        self.min_distance = min_distance  # 距離上一個保留點小於此公尺數…
+        self.min_interval = min_interval  # …且間隔小於此秒數時丟棄
+        self.max_pending = max_pending  # 暫存超過此數量時立即寫入
+        self.reject_ttl = reject_ttl  # 寫入被拒的司機在此秒數內的定位點直接丟棄
+        self._pending: Dict[str, List[tuple]] = {}
+        self._latest: Dict[str, tuple] = {}
+        self._last_kept: Dict[str, Tuple[float, float, datetime]] = {}
+        self._pending_count = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_now = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._rejected: Dict[str, float] = {}  # driverId -> 被拒時間（monotonic）
+        self.dead_letter = deque(maxlen=1000)  # 無法寫入的定位點，供人工檢查
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.written = 0
+        self.last_flush_ms = 0.0
+
+    def add(self, ping: Dict) -> bool:
+        """加入一個定位點；回傳 False 表示為重複點而被丟棄（最新位置仍會更新）"""
+        driver_id = ping["driverId"]
+        latitude, longitude = float(ping["latitude"]), float(ping["longitude"])
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError(f"座標超出範圍: {latitude}, {longitude}")
+        rejected_at = self._rejected.get(driver_id)
+        if rejected_at is not None:
+            if time.monotonic() - rejected_at < self.reject_ttl:
+                self.rejected += 1
+                return False
+            del self._rejected[driver_id]
+        created_at = _utc_naive(ping.get("createdAt") or datetime.now(timezone.utc))
+
+        row = (str(uuid.uuid4()), driver_id, latitude, longitude, ping.get("accuracy"), ping.get("speed"),
+               ping.get("heading"), ping.get("address"), ping.get("note"), created_at)
+
+        latest = self._latest.get(driver_id)
+        if latest is None or created_at >= latest[-1]:
+            self._latest[driver_id] = row
+
+        last = self._last_kept.get(driver_id)
+        if last is not None and not ping.get("note") and not ping.get("address"):
+            elapsed = (created_at - last[2]).total_seconds()
+            if 0 <= elapsed < self.min_interval and haversine(last[0], last[1], latitude, longitude) < self.min_distance:
+                self.dropped += 1
+                return False
+
+        self._last_kept[driver_id] = (latitude, longitude, created_at)
+        self._pending.setdefault(driver_id, []).append(row)
+        self._pending_count += 1
+        self.accepted += 1
+        if self._pending_count >= self.max_pending:
+            self._flush_now.set()
+        return True
+
+    async def flush(self) -> int:
+        """寫入暫存的定位點並更新最新位置；暫時性失敗時放回暫存，下次再試"""
+        async with self._flush_lock:
+            if not self._pending and not self._latest:
+                return 0
+            pending, self._pending, self._pending_count = self._pending, {}, 0
+            latest, self._latest = self._latest, {}
+
+            # 依司機排序，同一司機的點連續寫入，upsert 也有固定的上鎖順序
+            records = [row for driver_id in sorted(pending) for row in pending[driver_id]]
+            latest_rows = [latest[driver_id] for driver_id in sorted(latest)]
+            started = time.perf_counter()
+            try:
+                await self._write(records, latest_rows)
+                written = len(records)
+            except DATA_ERRORS as e:
+                logger.warning(f"寫入司機位置資料錯誤，改為逐司機寫入: {e}")
+                written = await self._write_per_driver(pending, latest)
+            except Exception as e:
+                logger.warning(f"寫入司機位置失敗，稍後重試: {e}")
+                self._requeue(pending, latest)
+                return 0
+
+            self.written += written
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            return written
+
+    async def _write(self, records: List[tuple], latest_rows: List[tuple]):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if records:
+                    await conn.copy_records_to_table("driver_locations", records=records, columns=_COLUMNS)
+                if latest_rows:
+                    await conn.execute("""
+                        INSERT INTO driver_latest_locations
+                            ("driverId", latitude, longitude, accuracy, speed, heading, address,
+                             "recordedAt", "seenAt", "updatedAt")
+                        SELECT d, lat, lng, acc, spd, hdg, addr, ts, ts, now() AT TIME ZONE 'UTC'
+                        FROM unnest($1::text[], $2::float8[], $3::float8[], $4::float8[], $5::float8[],
+                                    $6::float8[], $7::text[], $8::timestamp[])
+                             AS t(d, lat, lng, acc, spd, hdg, addr, ts)
+                        ON CONFLICT ("driverId") DO UPDATE SET
+                            latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude,
+                            accuracy = EXCLUDED.accuracy, speed = EXCLUDED.speed,
+                            heading = EXCLUDED.heading,
+                            address = COALESCE(EXCLUDED.address, driver_latest_locations.address),
+                            "recordedAt" = EXCLUDED."recordedAt", "seenAt" = EXCLUDED."seenAt",
+                            "updatedAt" = now() AT TIME ZONE 'UTC'
+                        WHERE EXCLUDED."recordedAt" >= driver_latest_locations."recordedAt"
+                    """, *[list(column) for column in zip(*[
+                        (row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[9])
+                        for row in latest_rows])])
+
+    async def _write_per_driver(self, pending: Dict[str, List[tuple]], latest: Dict[str, tuple]) -> int:
+        """逐司機寫入：資料錯誤的司機移到 dead_letter，暫時性失敗則把尚未寫入的司機放回暫存"""
+        written = 0
+        drivers = sorted(set(pending) | set(latest))
+        for position, driver_id in enumerate(drivers):
+            records = pending.get(driver_id, [])
+            latest_rows = [latest[driver_id]] if driver_id in latest else []
+            try:
+                await self._write(records, latest_rows)
+                written += len(records)
+            except DATA_ERRORS as e:
+                logger.error(f"司機 {driver_id} 的位置無法寫入，移到 dead_letter: {e}")
+                self.dead_letter.append({"driverId": driver_id, "points": records or latest_rows,
+                                         "error": f"{type(e).__name__}: {e}"})
+                self._rejected[driver_id] = time.monotonic()
+                self.rejected += len(records)
+            except Exception as e:
+                logger.warning(f"寫入司機位置失敗，稍後重試: {e}")
+                remaining = drivers[position:]
+                self._requeue({d: pending[d] for d in remaining if d in pending},
+                              {d: latest[d] for d in remaining if d in latest})
+                break
+        return written
+
+    def _requeue(self, pending: Dict[str, List[tuple]], latest: Dict[str, tuple]):
+        """寫入失敗時放回暫存（排在新進的點之前）"""
+        for driver_id, rows in pending.items():
+            self._pending.setdefault(driver_id, [])[:0] = rows
+            self._pending_count += len(rows)
+        for driver_id, row in latest.items():
+            current = self._latest.get(driver_id)
+            if current is None or row[-1] > current[-1]:
+                self._latest[driver_id] = row
+        # 下游長時間無法寫入時，避免暫存無限增長
+        overflow = self._pending_count - self.max_pending * 10
+        if overflow > 0:
+            self._drop_oldest(overflow)
+
+    def _drop_oldest(self, count: int):
+        for driver_id in list(self._pending):
+            rows = self._pending[driver_id]
+            removed = min(count, len(rows))
+            del rows[:removed]
+            count -= removed
+            self._pending_count -= removed
+            self.dropped += removed
+            if not rows:
+                del self._pending[driver_id]
+            if count <= 0:
+                break
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"司機位置寫入迴圈錯誤: {e}")
+
+    async def ensure_schema(self):
+        await self.pool.execute("""
+            CREATE TABLE IF NOT EXISTS driver_latest_locations (
+                "driverId" TEXT PRIMARY KEY REFERENCES "User"(id) ON DELETE CASCADE,
+                latitude DOUBLE PRECISION NOT NULL,
+                longitude DOUBLE PRECISION NOT NULL,
+                accuracy DOUBLE PRECISION,
+                speed DOUBLE PRECISION,
+                heading DOUBLE PRECISION,
+                address TEXT,
+                "recordedAt" TIMESTAMP(3) NOT NULL,
+                "seenAt" TIMESTAMP(3) NOT NULL,
+                "updatedAt" TIMESTAMP(3) NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')
+            )
+        """)
+        await self.pool.execute("""
+            CREATE INDEX IF NOT EXISTS driver_latest_locations_point_idx
+            ON driver_latest_locations USING gist (point(longitude, latitude))
+        """)
+        await self.pool.execute("""
+            CREATE INDEX IF NOT EXISTS driver_locations_driverId_createdAt_idx
+            ON driver_locations ("driverId", "createdAt")
+        """)
+        # 首次建立時以歷史軌跡回填，部署後不必等每位司機重新回報才有位置
+        await self.pool.execute("""
+            INSERT INTO driver_latest_locations
+                ("driverId", latitude, longitude, accuracy, speed, heading, address, "recordedAt", "seenAt")
+            SELECT DISTINCT ON (l."driverId") l."driverId", l.latitude, l.longitude, l.accuracy, l.speed,
+                   l.heading, l.address, l."createdAt", l."createdAt"
+            FROM driver_locations l
+            WHERE NOT EXISTS (SELECT 1 FROM driver_latest_locations)
+            ORDER BY l."driverId", l."createdAt" DESC
+            ON CONFLICT ("driverId") DO NOTHING
+        """)
+        await self.pool.execute("""
+            CREATE INDEX IF NOT EXISTS driver_locations_point_idx
+            ON driver_locations USING gist (point(longitude, latitude))
+        """)
+        await self.pool.execute("""
+            CREATE TABLE IF NOT EXISTS driver_location_compaction (
+                "driverId" TEXT NOT NULL,
+                day DATE NOT NULL,
+                "pointsBefore" INTEGER NOT NULL,
+                "pointsAfter" INTEGER NOT NULL,
+                "compressedAt" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY ("driverId", day)
+            )
+        """)
+
+    async def latest_positions(self) -> List[Dict]:
+        rows = await self.pool.fetch('SELECT * FROM driver_latest_locations ORDER BY "driverId"')
+        return [dict(row) for row in rows]
+
+    async def nearest_drivers(self, latitude: float, longitude: float, limit: int = 5,
+                              max_age: float = 900.0) -> List[Dict]:
+        """最近的司機（GiST KNN 排序，再以 haversine 計算實際距離）"""
+        rows = await self.pool.fetch("""
+            SELECT "driverId", latitude, longitude, "recordedAt"
+            FROM driver_latest_locations
+            WHERE "seenAt" > (now() AT TIME ZONE 'UTC') - make_interval(secs => $3)
+            ORDER BY point(longitude, latitude) <-> point($2, $1)
+            LIMIT $4
+        """, latitude, longitude, max_age, limit)
+        result = [dict(row) for row in rows]
+        for row in result:
+            row["distance"] = haversine(latitude, longitude, row["latitude"], row["longitude"])
+        return sorted(result, key=lambda row: row["distance"])
+
+    async def compress_history(self, older_than_days: int = 1, tolerance: float = 10.0,
+                               limit: Optional[int] = None) -> Dict[str, int]:
+        """把尚未壓縮、早於 older_than_days 天的軌跡逐司機逐日簡化"""
+        cutoff = _utc_naive(datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=older_than_days - 1)
+        tracks = await self.pool.fetch("""
+            SELECT l."driverId", l."createdAt"::date AS day
+            FROM driver_locations l
+            WHERE l."createdAt" < $1
+            GROUP BY 1, 2
+            HAVING NOT EXISTS (SELECT 1 FROM driver_location_compaction c
+                               WHERE c."driverId" = l."driverId" AND c.day = l."createdAt"::date)
+            ORDER BY 2, 1
+        """ + (f" LIMIT {int(limit)}" if limit else ""), cutoff)
+
+        totals = {"tracks": 0, "before": 0, "after": 0}
+        for track in tracks:
+            driver_id, day = track["driverId"], track["day"]
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    points = await conn.fetch("""
+                        SELECT id, latitude, longitude, note, address FROM driver_locations
+                        WHERE "driverId" = $1 AND "createdAt" >= $2::date AND "createdAt" < $2::date + 1
+                        ORDER BY "createdAt", id
+                        FOR UPDATE
+                    """, driver_id, day)
+                    keep = set(simplify_track([(p["latitude"], p["longitude"]) for p in points], tolerance))
+                    # 有備註或地址的點是人工標記，一律保留
+                    remove = [p["id"] for i, p in enumerate(points) if i not in keep and not p["note"] and not p["address"]]
+                    if remove:
+                        await conn.execute("DELETE FROM driver_locations WHERE id = ANY($1::text[])", remove)
+                    await conn.execute("""
+                        INSERT INTO driver_location_compaction ("driverId", day, "pointsBefore", "pointsAfter")
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT ("driverId", day) DO NOTHING
+                    """, driver_id, day, len(points), len(points) - len(remove))
+            totals["tracks"] += 1
+            totals["before"] += len(points)
+            totals["after"] += len(points) - len(remove)
+        return totals
+
+    async def start(self):
+        if self._flush_task is not None:
+            return
+        await self.pool.open()
+        await self.ensure_schema()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self._pending_count,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "deadLetter": len(self.dead_letter),
+            "written": self.written,
+            "lastFlushMs": round(self.last_flush_ms, 1),
+        }
+
+    def attach(self, app):
+        """掛到 FastAPI：啟動時建立資料表與寫入迴圈，關閉前寫完暫存（排在連線池關閉之前）"""
+        app.add_event_handler("startup", self.start)
+        app.router.on_shutdown.insert(0, self.close)
+        return self
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from line_bot_db_pool import LineBotPool
+
+    parser = argparse.ArgumentParser(description="司機 GPS 軌跡維護")
+    parser.add_argument("action", choices=["install", "compress"], help="install: 建立資料表與索引；compress: 簡化歷史軌跡")
+    parser.add_argument("--older-than", type=int, default=1, help="只壓縮幾天前的軌跡")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Douglas-Peucker 容許誤差（公尺）")
+    parser.add_argument("--limit", type=int, help="最多處理幾個司機日")
+
+    args = parser.parse_args()
+
+    async def _main():
+        pool = LineBotPool(health_check_interval=0)
+        await pool.open()
+        ingestor = DriverLocationIngestor(pool)
+        try:
+            await ingestor.ensure_schema()
+            print("✓ 已建立 driver_latest_locations 與 GiST / 軌跡索引")
+            if args.action == "compress":
+                started = time.perf_counter()
+                totals = await ingestor.compress_history(args.older_than, args.tolerance, args.limit)
+                ratio = 100 * (1 - totals["after"] / totals["before"]) if totals["before"] else 0
+                print(f"✓ 壓縮 {totals['tracks']} 條軌跡：{totals['before']:,} → {totals['after']:,} 點"
+                      f"（減少 {ratio:.1f}%），{time.perf_counter() - started:.1f}s")
+        finally:
+            await pool.close()
+
+    asyncio.run(_main())
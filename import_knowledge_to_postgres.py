@@ -5,6 +5,7 @@ import sys
 sys.path.append('line_bot_ai/app')
 
 from knowledge import KNOWLEDGE_BASE
+from knowledge_category_classifier import CategoryClassifier, get_default_classifier
 
 def get_database_connection():
     return psycopg2.connect(
@@ -27,6 +28,11 @@ def import_knowledge_to_postgres():
         imported_count = 0
         skipped_count = 0
         
+        # 一次批次分類所有主題（資料表規則優先，否則使用設定檔）
+        classifier = CategoryClassifier.from_config(cursor)
+        topics = list(KNOWLEDGE_BASE.keys())
+        categories = dict(zip(topics, classifier.classify_many(topics)))
+        
         for topic, data in KNOWLEDGE_BASE.items():
             try:
                 knowledge_id = str(uuid.uuid4())
@@ -35,7 +41,7 @@ def import_knowledge_to_postgres():
                 content = data['content'].strip()
                 keywords = data.get('keywords', [])
                 priority = 0
-                category = classify_category(topic)
+                category = categories[topic]
                 
                 # 檢查是否已存在
                 cursor.execute('''
@@ -110,38 +116,7 @@ def import_knowledge_to_postgres():
 
 def classify_category(topic):
     """根據主題分類"""
-    topic_lower = topic.lower()
-    
-    if any(kw in topic_lower for kw in ['安全', '緊急', '意外', '漏氣']):
-        return '安全'
-    elif any(kw in topic_lower for kw in ['瓦斯爐', '爐具', '點火']):
-        return '瓦斯爐'
-    elif any(kw in topic_lower for kw in ['熱水器']):
-        return '熱水器'
-    elif any(kw in topic_lower for kw in ['排油煙機', '油煙機']):
-        return '排油煙機'
-    elif any(kw in topic_lower for kw in ['瓦斯桶', '瓦斯罐', 'LPG']):
-        return '瓦斯桶'
-    elif any(kw in topic_lower for kw in ['調整器', '減壓器']):
-        return '調整器'
-    elif any(kw in topic_lower for kw in ['收費', '價格', '費用']):
-        return '收費標準'
-    elif any(kw in topic_lower for kw in ['客戶服務', '服務', '客服']):
-        return '客戶服務'
-    elif any(kw in topic_lower for kw in ['保養', '維護', '檢修']):
-        return '定期保養'
-    elif any(kw in topic_lower for kw in ['法規', '規定', '標準']):
-        return '法規'
-    elif any(kw in topic_lower for kw in ['品牌', '型號', '廠牌']):
-        return '產品資訊'
-    elif any(kw in topic_lower for kw in ['工具', '設備', '儀器']):
-        return '專業工具'
-    elif any(kw in topic_lower for kw in ['故障', '診斷', '排除']):
-        return '故障排除'
-    elif any(kw in topic_lower for kw in ['零件', '更換', '維修']):
-        return '零件更換'
-    else:
-        return '其他'
+    return get_default_classifier().classify(topic)
 
 if __name__ == "__main__":
     count = import_knowledge_to_postgres()
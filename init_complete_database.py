@@ -532,7 +532,8 @@ def init_complete_database():
             cursor.execute('''
                 INSERT INTO "MonthlyStatement" 
                 (id, "customerId", month, "periodStart", "periodEnd", "totalOrders", "totalAmount", "paidAmount", balance, status, "createdAt", "updatedAt")
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT DO NOTHING;
             ''', (
                 str(uuid.uuid4()),
                 customer_id,
@@ -673,7 +674,25 @@ def init_complete_database():
         conn.close()
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="初始化完整PostgreSQL數據庫")
+    parser.add_argument("--bulk", action="store_true", help="初始化後再產生大量合成資料（壓測用）")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子（相同種子產生相同資料）")
+    parser.add_argument("--customers", type=int, default=50000, help="合成客戶數")
+    parser.add_argument("--orders", type=int, default=1000000, help="合成訂單數")
+    parser.add_argument("--drivers", type=int, default=20, help="合成司機數")
+    parser.add_argument("--days", type=int, default=365, help="訂單與 GPS 軌跡涵蓋天數")
+    parser.add_argument("--ping-interval", type=int, default=300, help="司機 GPS 回報間隔（秒）")
+    parser.add_argument("--keep", action="store_true", help="不先刪除同一種子先前產生的資料")
+    args = parser.parse_args()
+
     success = init_complete_database()
+    if success and args.bulk:
+        from bulk_seed import seed_bulk_dataset
+        success = seed_bulk_dataset(seed=args.seed, customers=args.customers, orders=args.orders,
+                                    drivers=args.drivers, days=args.days, ping_interval=args.ping_interval,
+                                    reset=not args.keep)
     if success:
         print("\n✓ 數據庫初始化成功，所有資料已持久化到PostgreSQL")
         print("✓ 現在可以進行系統測試")
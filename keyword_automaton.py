@@ -0,0 +1,128 @@
+"""
+Aho-Corasick 關鍵字自動機
+將多組關鍵字編譯成單一自動機，對輸入文字只掃描一次即可找出所有命中的關鍵字，
+取代逐一 `any(kw in text for kw in ...)` 的多次掃描。
+"""
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+def _boundary_flags(keyword: str) -> int:
+    """英數字開頭需檢查前一字元（1）、結尾需檢查後一字元（2）；中文關鍵字不受影響"""
+    return (1 if _is_word_char(keyword[0]) else 0) | (2 if _is_word_char(keyword[-1]) else 0)
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式字串比對自動機"""
+
+    def __init__(self, case_insensitive: bool = True, word_boundary: bool = False):
+        self.case_insensitive = case_insensitive
+        # 英數字關鍵字只在單字邊界命中（hi 不會命中 this），中文仍以子字串比對
+        self.word_boundary = word_boundary
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any, int, int]]] = [[]]
+        self._built = False
+
+    def _normalize(self, text: str) -> str:
+        return text.lower() if self.case_insensitive else text
+
+    def add(self, keyword: str, value: Any = None):
+        """加入關鍵字，value 為命中時回傳的標記（預設為關鍵字本身）"""
+        if not keyword:
+            return
+        node = 0
+        normalized = self._normalize(keyword)
+        for ch in normalized:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        flags = _boundary_flags(normalized) if self.word_boundary else 0
+        self._output[node].append((keyword, keyword if value is None else value, len(normalized), flags))
+        self._built = False
+
+    def add_many(self, keywords: Iterable[str], value: Any = None):
+        for keyword in keywords:
+            self.add(keyword, value)
+
+    def build(self):
+        """建立失敗連結（BFS），並把後綴節點的輸出合併進來"""
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            queue.append(node)
+
+        while queue:
+            current = queue.popleft()
+            for ch, child in self._goto[current].items():
+                queue.append(child)
+                fallback = self._fail[current]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """逐一產生命中結果 (結束位置, 關鍵字, 標記)"""
+        if not self._built:
+            self.build()
+        node = 0
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        text = self._normalize(text)
+        for index, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node]:
+                for keyword, value, length, flags in output[node]:
+                    if flags & 1 and index >= length and _is_word_char(text[index - length]):
+                        continue
+                    if flags & 2 and index + 1 < len(text) and _is_word_char(text[index + 1]):
+                        continue
+                    yield index, keyword, value
+
+    def find_values(self, text: str) -> Set[Any]:
+        """回傳所有命中的標記集合"""
+        return {value for _, _, value in self.iter_matches(text)}
+
+    def count_values(self, text: str) -> Dict[Any, int]:
+        """回傳每個標記的命中次數"""
+        counts: Dict[Any, int] = {}
+        for _, _, value in self.iter_matches(text):
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def contains_any(self, text: str) -> bool:
+        """是否至少命中一個關鍵字"""
+        for _ in self.iter_matches(text):
+            return True
+        return False
+
+    def export_tables(self) -> Tuple[List[Dict[str, int]], List[int], List[bool]]:
+        """匯出 (goto, fail, 是否有輸出) 表，供產生其他語言的比對程式"""
+        if not self._built:
+            self.build()
+        return [dict(edges) for edges in self._goto], list(self._fail), [bool(out) for out in self._output]
+
+    def export_hits(self) -> List[List[Tuple[int, int]]]:
+        """匯出每個節點的輸出 [(關鍵字長度, 邊界旗標)]，供其他語言實作單字邊界檢查"""
+        if not self._built:
+            self.build()
+        return [sorted({(length, flags) for _, _, length, flags in out}) for out in self._output]
+
+    def __len__(self):
+        return len(self._goto)
@@ -0,0 +1,190 @@
+"""
+知識庫分類器
+將分類規則表（設定檔或資料表）編譯成單一 Aho-Corasick 自動機，
+一次掃描即可判定分類；規則未命中時可選擇以 embedding 最近中心點補分類。
+匯入時批次分類，查詢時也可用來把問題導向正確的分類。
+"""
+import json
+import math
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from keyword_automaton import KeywordAutomaton
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledge_category_rules.json')
+DEFAULT_CATEGORY = '其他'
+
+
+def load_rules_from_file(path: str = RULES_FILE) -> Tuple[List[Tuple[str, List[str]]], str]:
+    """從 JSON 設定檔載入規則，回傳 (依優先順序排列的規則, 預設分類)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    rules = [(rule['category'], list(rule['keywords'])) for rule in config.get('rules', [])]
+    return rules, config.get('default_category', DEFAULT_CATEGORY)
+
+
+def load_rules_from_db(cursor) -> Optional[List[Tuple[str, List[str]]]]:
+    """從 knowledge_category_rules 資料表載入規則，資料表不存在或為空時回傳 None"""
+    cursor.execute("SELECT to_regclass('public.knowledge_category_rules');")
+    if cursor.fetchone()[0] is None:
+        return None
+
+    cursor.execute('''
+        SELECT category, keyword, priority
+        FROM "knowledge_category_rules"
+        WHERE "isActive" = true
+        ORDER BY priority, category;
+    ''')
+    rules: Dict[str, List[str]] = {}
+    for category, keyword, _ in cursor.fetchall():
+        rules.setdefault(category, []).append(keyword)
+    return list(rules.items()) or None
+
+
+def sync_rules_to_db(conn, rules: List[Tuple[str, List[str]]]):
+    """建立 knowledge_category_rules 資料表並以給定規則覆寫內容"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS "knowledge_category_rules" (
+                "id" SERIAL PRIMARY KEY,
+                "category" TEXT NOT NULL,
+                "keyword" TEXT NOT NULL,
+                "priority" INTEGER NOT NULL DEFAULT 0,
+                "isActive" BOOLEAN DEFAULT true,
+                "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        ''')
+        cursor.execute('DELETE FROM "knowledge_category_rules";')
+        for priority, (category, keywords) in enumerate(rules):
+            for keyword in keywords:
+                cursor.execute('''
+                    INSERT INTO "knowledge_category_rules" (category, keyword, priority)
+                    VALUES (%s, %s, %s);
+                ''', (category, keyword, priority))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _mean(vectors: List[Sequence[float]]) -> List[float]:
+    count = len(vectors)
+    return [sum(column) / count for column in zip(*vectors)]
+
+
+class CategoryClassifier:
+    """規則自動機 + 可選 embedding 最近中心點的分類器"""
+
+    def __init__(self, rules: List[Tuple[str, List[str]]], default_category: str = DEFAULT_CATEGORY,
+                 embed_batch: Optional[Callable[[List[str]], List[Sequence[float]]]] = None,
+                 min_similarity: float = 0.75):
+        self.categories = [category for category, _ in rules]
+        self.default_category = default_category
+        self.embed_batch = embed_batch  # 批次產生 embedding 的函數，None 表示不使用補分類
+        self.min_similarity = min_similarity
+        self.centroids: Dict[str, List[float]] = {}
+
+        # 規則順序即優先順序：同時命中多個分類時取排在前面的
+        self.automaton = KeywordAutomaton()
+        for priority, (_, keywords) in enumerate(rules):
+            self.automaton.add_many(keywords, priority)
+        self.automaton.build()
+
+    @classmethod
+    def from_config(cls, cursor=None, path: str = RULES_FILE, **kwargs) -> 'CategoryClassifier':
+        """優先讀取資料表規則，沒有時使用設定檔"""
+        rules, default_category = load_rules_from_file(path)
+        if cursor is not None:
+            db_rules = load_rules_from_db(cursor)
+            if db_rules:
+                rules = db_rules
+        kwargs.setdefault('default_category', default_category)
+        return cls(rules, **kwargs)
+
+    def match_categories(self, text: str) -> List[str]:
+        """回傳所有命中的分類（依優先順序）"""
+        return [self.categories[p] for p in sorted(self.automaton.find_values(text))]
+
+    def match_rule(self, text: str) -> Optional[str]:
+        """只用規則判定，未命中回傳 None"""
+        priorities = self.automaton.find_values(text)
+        return self.categories[min(priorities)] if priorities else None
+
+    def fit_centroids(self, texts: List[str], categories: List[str], vectors: Optional[List[Sequence[float]]] = None):
+        """以已知分類的文字計算各分類的 embedding 中心點"""
+        if self.embed_batch is None:
+            return
+        if vectors is None:
+            vectors = self.embed_batch(texts)
+        grouped: Dict[str, List[Sequence[float]]] = {}
+        for category, vector in zip(categories, vectors):
+            if category != self.default_category and vector:
+                grouped.setdefault(category, []).append(vector)
+        self.centroids = {category: _mean(items) for category, items in grouped.items()}
+
+    def _nearest_centroid(self, vector: Sequence[float]) -> Optional[str]:
+        best_category, best_score = None, self.min_similarity
+        for category, centroid in self.centroids.items():
+            score = _cosine(vector, centroid)
+            if score >= best_score:
+                best_category, best_score = category, score
+        return best_category
+
+    def classify(self, text: str) -> str:
+        """分類單一文字"""
+        return self.classify_many([text])[0]
+
+    def classify_many(self, texts: List[str]) -> List[str]:
+        """批次分類：先跑規則，未命中的文字一次批次取 embedding 做最近中心點補分類"""
+        results = [self.match_rule(text) for text in texts]
+        unmatched = [i for i, category in enumerate(results) if category is None]
+
+        if unmatched and self.embed_batch is not None:
+            if not self.centroids:
+                matched = [i for i, category in enumerate(results) if category is not None]
+                all_vectors = self.embed_batch([texts[i] for i in matched + unmatched])
+                self.fit_centroids([texts[i] for i in matched], [results[i] for i in matched],
+                                   all_vectors[:len(matched)])
+                unmatched_vectors = all_vectors[len(matched):]
+            else:
+                unmatched_vectors = self.embed_batch([texts[i] for i in unmatched])
+
+            for i, vector in zip(unmatched, unmatched_vectors):
+                results[i] = self._nearest_centroid(vector)
+
+        return [category or self.default_category for category in results]
+
+    def route_question(self, question: str) -> Optional[str]:
+        """查詢時把問題導向分類，無法判定時回傳 None（不套用預設分類）"""
+        category = self.classify(question)
+        return None if category == self.default_category else category
+
+
+_default_classifier: Optional[CategoryClassifier] = None
+
+
+def get_default_classifier() -> CategoryClassifier:
+    """取得以設定檔規則建立的共用分類器"""
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = CategoryClassifier.from_config()
+    return _default_classifier
+
+
+if __name__ == "__main__":
+    classifier = get_default_classifier()
+    samples = ["瓦斯漏氣緊急處理", "熱水器不點火", "LPG 瓦斯桶規格", "收費標準", "公司簡介"]
+    print("=" * 60)
+    print("知識庫分類器測試")
+    print("=" * 60)
+    for sample, category in zip(samples, classifier.classify_many(samples)):
+        print(f"  {sample} → {category}  (命中: {classifier.match_categories(sample)})")
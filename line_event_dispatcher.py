@@ -0,0 +1,101 @@
+"""
+LINE 事件分派器
+把一次 webhook 送來的多個事件分派到固定數量的 worker：
+同一對話（群組 / 聊天室 / 使用者）的事件固定送到同一個 worker 以保持順序，
+不同對話的事件則並行處理；佇列滿時 dispatch 會等待，形成背壓。
+"""
+import asyncio
+import logging
+import zlib
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def conversation_key(event: Dict) -> str:
+    """事件所屬的對話：群組 > 聊天室 > 使用者"""
+    source = event.get("source", {})
+    return source.get("groupId") or source.get("roomId") or source.get("userId") or "unknown"
+
+
+class KeyedEventDispatcher:
+    """依對話分片的有界 worker 池"""
+
+    def __init__(self, handler: Callable[[Dict], Awaitable[None]], workers: int = 8,
+                 queue_size: int = 100, key_func: Callable[[Dict], str] = conversation_key):
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size  # 每個 worker 的佇列上限，滿了 dispatch 會等待
+        self.key_func = key_func
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.processed_count = 0
+        self.error_count = 0
+
+    def _shard(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % self.workers
+
+    async def start(self):
+        """建立 worker"""
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            event, done = await queue.get()
+            try:
+                await self.handler(event)
+                self.processed_count += 1
+                if done is not None and not done.done():
+                    done.set_result(None)
+            except Exception as e:
+                self.error_count += 1
+                logger.error(f"處理 LINE 事件失敗 ({self.key_func(event)}): {e}")
+                if done is not None and not done.done():
+                    done.set_exception(e)
+            finally:
+                queue.task_done()
+
+    async def dispatch(self, events: List[Dict], wait: bool = False) -> Optional[List]:
+        """分派事件；wait=True 時等全部處理完（回傳每個事件的結果或例外）"""
+        if not self._tasks:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for event in events:
+            done = loop.create_future() if wait else None
+            await self._queues[self._shard(self.key_func(event))].put((event, done))
+            if done is not None:
+                futures.append(done)
+        if wait:
+            return await asyncio.gather(*futures, return_exceptions=True)
+        return None
+
+    def saturated(self) -> bool:
+        """是否有 worker 佇列已滿"""
+        return any(queue.full() for queue in self._queues)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queued": sum(queue.qsize() for queue in self._queues),
+            "processed": self.processed_count,
+            "errors": self.error_count,
+        }
+
+    async def close(self):
+        """等佇列中的事件處理完後停止 worker"""
+        for queue in self._queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def attach(self, app):
+        """掛到 FastAPI：關閉時排在最前面，先處理完事件再寫入日誌、關閉連線池"""
+        app.add_event_handler("startup", self.start)
+        app.router.on_shutdown.insert(0, self.close)
+        return self
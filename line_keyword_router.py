@@ -0,0 +1,167 @@
+"""
+LINE 訊息關鍵字路由
+把觸發關鍵字清單與各意圖的關鍵字集合（line_keyword_triggers.json）編譯成單一 Aho-Corasick 自動機，
+對每則訊息只掃描一次，就能同時判斷是否需要回覆以及命中哪些意圖。
+意圖關鍵字依 Bot 分開設定（intents 下以產生的 Bot 名稱區分）；英數字關鍵字只在單字邊界命中（hi 不會命中 this）。
+同一份清單也可以產生 TypeScript 版的 KEYWORD_TRIGGERS / containsTriggerKeyword（供 scripts/patch-line-keywords.py 注入 route.ts）。
+"""
+import json
+import os
+from typing import Dict, List, Optional
+
+from keyword_automaton import KeywordAutomaton
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "line_keyword_triggers.json")
+
+_TRIGGER = "__trigger__"
+
+
+def _ts_string(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+class RouteResult:
+    """一則訊息的路由結果"""
+
+    def __init__(self, triggered: bool, intents: List[str], keywords: List[str]):
+        self.triggered = triggered  # 是否需要回覆（命中觸發關鍵字或為指令格式）
+        self.intents = intents  # 命中的意圖，依設定檔順序
+        self.keywords = keywords  # 命中的關鍵字，依出現順序
+
+    def __repr__(self):
+        return f"RouteResult(triggered={self.triggered}, intents={self.intents})"
+
+
+class KeywordRouter:
+    """觸發關鍵字 + 意圖關鍵字的單次掃描路由"""
+
+    def __init__(self, triggers: List[Dict], intents: Dict[str, List[str]], command_prefixes: List[str]):
+        self.triggers = triggers
+        self.intents = intents
+        self.command_prefixes = tuple(command_prefixes)
+        self._intent_order = {name: index for index, name in enumerate(intents)}
+
+        self.automaton = KeywordAutomaton(case_insensitive=True, word_boundary=True)
+        for group in triggers:
+            self.automaton.add_many(group["keywords"], _TRIGGER)
+        for name, keywords in intents.items():
+            self.automaton.add_many(keywords, name)
+        self.automaton.build()
+
+        # TypeScript 只需要觸發關鍵字的自動機
+        self.trigger_automaton = KeywordAutomaton(case_insensitive=True, word_boundary=True)
+        for keyword in self.trigger_keywords():
+            self.trigger_automaton.add(keyword)
+        self.trigger_automaton.build()
+
+    @classmethod
+    def from_config(cls, path: Optional[str] = None, bot: Optional[str] = None) -> "KeywordRouter":
+        """bot 為 intents 中的 Bot 名稱；未指定時只判斷觸發關鍵字（例如產生 TypeScript）"""
+        with open(path or CONFIG_PATH, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        intents = {}
+        if bot is not None:
+            if bot not in config["intents"]:
+                raise KeyError(f"line_keyword_triggers.json 沒有 {bot} 的意圖設定")
+            intents = config["intents"][bot]
+        return cls(config["triggers"], intents, config.get("command_prefixes", []))
+
+    def trigger_keywords(self) -> List[str]:
+        """觸發關鍵字（去除重複，保留順序）"""
+        return list(dict.fromkeys(keyword for group in self.triggers for keyword in group["keywords"]))
+
+    def route(self, text: str) -> RouteResult:
+        # 指令格式以原始訊息判斷，與 route.ts 一致
+        triggered = text.startswith(self.command_prefixes) if self.command_prefixes else False
+        intents = set()
+        keywords = []
+        for _, keyword, value in self.automaton.iter_matches(text.strip()):
+            if value == _TRIGGER:
+                triggered = True
+            else:
+                intents.add(value)
+            keywords.append(keyword)
+        return RouteResult(triggered, sorted(intents, key=self._intent_order.get), list(dict.fromkeys(keywords)))
+
+    def match_intents(self, text: str) -> List[str]:
+        return self.route(text).intents
+
+    def should_reply(self, text: str) -> bool:
+        return self.route(text).triggered
+
+    def render_typescript(self) -> str:
+        """產生 route.ts 使用的 KEYWORD_TRIGGERS 與 containsTriggerKeyword"""
+        goto, fail, _ = self.trigger_automaton.export_tables()
+        hits = self.trigger_automaton.export_hits()
+        lines = [
+            "",
+            "// 關鍵字觸發配置 - 只有包含這些關鍵字的訊息才會回覆",
+            "// 由 line_keyword_router.py 依 line_keyword_triggers.json 產生，請勿手動修改",
+            "const KEYWORD_TRIGGERS = [",
+        ]
+        for group in self.triggers:
+            lines.append(f"  // {group['label']}")
+            lines.append("  " + ", ".join(_ts_string(keyword) for keyword in group["keywords"]) + ",")
+        lines.append("]")
+        lines.append("")
+        lines.append("// KEYWORD_TRIGGERS 編譯後的 Aho-Corasick 自動機：一次掃描訊息即可判斷是否命中")
+        lines.append("// TRIGGER_HIT[node] = [關鍵字長度, 邊界旗標]：1 前一字元、2 後一字元不可為英數字")
+        lines.append("const TRIGGER_GOTO: Record<string, number>[] = " + json.dumps(goto, ensure_ascii=False, separators=(",", ":")))
+        lines.append("const TRIGGER_FAIL: number[] = " + json.dumps(fail, separators=(",", ":")))
+        lines.append("const TRIGGER_HIT: [number, number][][] = " + json.dumps(hits, separators=(",", ":")))
+        prefixes = " || ".join(f"message.startsWith({_ts_string(prefix)})"
+                               for prefix in self.command_prefixes) or "false"
+        lines.extend([
+            "",
+            "function isWordChar(ch: string | undefined): boolean {",
+            "  return ch !== undefined && /^[a-z0-9]$/.test(ch)",
+            "}",
+            "",
+            "function containsTriggerKeyword(message: string): boolean {",
+            "  const chars = Array.from(message.toLowerCase().trim())",
+            "  let node = 0",
+            "  for (let i = 0; i < chars.length; i++) {",
+            "    const ch = chars[i]",
+            "    while (node && TRIGGER_GOTO[node][ch] === undefined) node = TRIGGER_FAIL[node]",
+            "    node = TRIGGER_GOTO[node][ch] ?? 0",
+            "    for (const [length, flags] of TRIGGER_HIT[node]) {",
+            "      if ((flags & 1) && isWordChar(chars[i - length])) continue",
+            "      if ((flags & 2) && isWordChar(chars[i + 1])) continue",
+            "      return true",
+            "    }",
+            "  }",
+            f"  return {prefixes}",
+            "}",
+            "",
+        ])
+        return "\n".join(lines)
+
+
+_default_routers: Dict[Optional[str], KeywordRouter] = {}
+
+
+def get_default_router(bot: Optional[str] = None) -> KeywordRouter:
+    """依 Bot 名稱取得（並快取）路由器"""
+    if bot not in _default_routers:
+        _default_routers[bot] = KeywordRouter.from_config(bot=bot)
+    return _default_routers[bot]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="LINE 訊息關鍵字路由")
+    parser.add_argument("action", choices=["route", "typescript"], help="route: 測試訊息；typescript: 輸出 TS 程式碼")
+    parser.add_argument("text", nargs="*", help="要測試的訊息")
+    parser.add_argument("--bot", help="使用哪個 Bot 的意圖設定（例如 fixed_uuid_bot）")
+
+    args = parser.parse_args()
+    router = get_default_router(args.bot)
+
+    if args.action == "typescript":
+        print(router.render_typescript())
+    else:
+        for text in args.text:
+            result = router.route(text)
+            mark = "✓" if result.triggered else "✗"
+            print(f"{mark} {text} -> 意圖: {', '.join(result.intents) or '無'}  關鍵字: {', '.join(result.keywords)}")
@@ -0,0 +1,135 @@
+"""
+LINE 對話記錄串流查詢
+以 (timestamp, id) keyset 游標分頁，支援群組、使用者與日期區間篩選，
+透過伺服器端游標逐批讀取並輸出 NDJSON，翻閱數十萬筆訊息時記憶體固定、也不需要 OFFSET 掃描。
+最後一行為 {"next_cursor": ...}，下一頁把它帶回 cursor 參數即可；沒有下一頁時為 null。
+timestamp 為 NULL 的舊資料無法以游標定位，不會出現在結果中。
+"""
+import base64
+import json
+from datetime import date, datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+MAX_LIMIT = 100000
+
+
+class LogStreamSpec:
+    """LineMessage 在各版本的欄位對應（欄位名稱為已加引號的 SQL 片段）"""
+
+    def __init__(self, table: str, id_column: str, timestamp_column: str,
+                 group_column: str, user_column: str, fields: Dict[str, str], id_type: type = str):
+        self.table = table
+        self.id_column = id_column
+        self.timestamp_column = timestamp_column
+        self.group_column = group_column
+        self.user_column = user_column
+        self.fields = fields  # 輸出名稱 -> 欄位
+        self.id_type = id_type  # id 欄位型別（str 或 int），用來驗證 cursor
+
+
+def encode_cursor(timestamp: datetime, record_id) -> str:
+    payload = json.dumps([timestamp.isoformat(), record_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _naive(value: datetime) -> datetime:
+    """欄位為 timestamp without time zone（UTC）；帶時區的時間先轉成 UTC"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def decode_cursor(token: str, id_type: type = str) -> Tuple[datetime, object]:
+    try:
+        timestamp, record_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        timestamp = _naive(datetime.fromisoformat(timestamp))
+        if isinstance(record_id, bool) or not isinstance(record_id, (str, int)):
+            raise TypeError(record_id)
+        return timestamp, id_type(record_id)
+    except Exception:
+        raise ValueError("cursor 格式錯誤")
+
+
+def _parse_time(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return _naive(datetime.fromisoformat(value))
+    except ValueError:
+        raise ValueError(f"{name} 需為 ISO 日期或時間，例如 2025-01-31")
+
+
+def parse_log_params(group: Optional[str] = None, user: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None,
+                     cursor: Optional[str] = None, limit: int = 20,
+                     spec: Optional[LogStreamSpec] = None) -> Dict:
+    """驗證並正規化查詢參數；格式錯誤時拋出 ValueError（須在開始串流前呼叫，才能回傳 400）"""
+    if limit < 0 or limit > MAX_LIMIT:
+        raise ValueError(f"limit 需介於 0 到 {MAX_LIMIT}（0 表示不限筆數）")
+    return {
+        "group": group,
+        "user": user,
+        "since": _parse_time(since, "since"),
+        "until": _parse_time(until, "until"),
+        "after": decode_cursor(cursor, spec.id_type if spec else str) if cursor else None,
+        "limit": limit,
+    }
+
+
+def build_log_query(spec: LogStreamSpec, group=None, user=None, since=None, until=None,
+                    after=None, limit: int = 20) -> Tuple[str, List]:
+    """組出 keyset 查詢（新到舊）"""
+    conditions = [f"{spec.timestamp_column} IS NOT NULL"]
+    args: List = []
+
+    def arg(value) -> str:
+        args.append(value)
+        return f"${len(args)}"
+
+    if group:
+        conditions.append(f"{spec.group_column} = {arg(group)}")
+    if user:
+        conditions.append(f"{spec.user_column} = {arg(user)}")
+    if since:
+        conditions.append(f"{spec.timestamp_column} >= {arg(since)}")
+    if until:
+        conditions.append(f"{spec.timestamp_column} < {arg(until)}")
+    if after:
+        conditions.append(f"({spec.timestamp_column}, {spec.id_column}) < ({arg(after[0])}, {arg(after[1])})")
+
+    fields = ", ".join(spec.fields.values())
+    sql = f"SELECT {spec.timestamp_column}, {spec.id_column}, {fields} FROM {spec.table}"
+    sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {spec.timestamp_column} DESC, {spec.id_column} DESC"
+    if limit:
+        sql += f" LIMIT {arg(limit)}"
+    return sql, args
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+async def stream_logs(pool, spec: LogStreamSpec, prefetch: int = 500, **params) -> AsyncIterator[bytes]:
+    """以伺服器端游標逐筆輸出 NDJSON"""
+    sql, args = build_log_query(spec, **params)
+    limit = params.get("limit")
+    count = 0
+    last = None
+
+    async with pool.acquire() as conn:
+        # asyncpg 的伺服器端游標必須在交易中使用
+        async with conn.transaction(readonly=True):
+            async for record in conn.cursor(sql, *args, prefetch=prefetch):
+                timestamp, record_id = record[0], record[1]
+                item = {"id": record_id, "timestamp": _json_value(timestamp)}
+                for position, name in enumerate(spec.fields, start=2):
+                    item[name] = _json_value(record[position])
+                yield (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+                count += 1
+                last = (timestamp, record_id)
+
+    next_cursor = encode_cursor(*last) if limit and count == limit and last else None
+    yield (json.dumps({"next_cursor": next_cursor}) + "\n").encode("utf-8")
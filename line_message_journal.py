@@ -0,0 +1,199 @@
+"""
+LINE 訊息寫後日誌（write-behind journal）
+Webhook 事件先寫入本機 SQLite（WAL 模式）日誌後立即回應，
+背景 flusher 再批次寫入 PostgreSQL 的 LineMessage；寫入成功才從日誌刪除，
+程式重啟時會自動重播尚未寫入的記錄，讓 LINE webhook 回應時間不再取決於資料庫延遲。
+資料本身有問題的記錄（型別錯誤、違反約束）會被二分找出並移到 dead_letter 表，不會卡住後續寫入；
+重播可能重複寫入同一批，insert_sql 應帶穩定的冪等鍵（例如 webhookEventId）並使用 ON CONFLICT DO NOTHING。
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import asyncpg
+    # 重試也不會成功的錯誤：只影響個別記錄，應移到 dead_letter 而非整批重試
+    DATA_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError, asyncpg.PostgresSyntaxError)
+except ImportError:
+    DATA_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__dt__": value.isoformat()}
+    raise TypeError(f"無法序列化: {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__dt__" in obj:
+        return datetime.fromisoformat(obj["__dt__"])
+    return obj
+
+
+class MessageJournal:
+    """SQLite WAL 日誌 + 非同步批次寫入 PostgreSQL"""
+
+    def __init__(self, path: str, insert_sql: str, pool, batch_size: int = 200,
+                 flush_interval: float = 1.0, retry_delay: float = 5.0):
+        self.path = path
+        self.insert_sql = insert_sql  # 單筆 INSERT（$1...$n），以 executemany 批次執行
+        self.pool = pool  # line_bot_db_pool.LineBotPool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        ''')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS dead_letter (
+                seq INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                error TEXT NOT NULL,
+                created REAL NOT NULL,
+                failed REAL NOT NULL
+            )
+        ''')
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._appended = 0  # 上次寫入後新增的筆數，用來決定是否提前喚醒 flusher
+        self._flush_lock = asyncio.Lock()  # 背景 flusher 與手動 flush 不可同時讀取同一批記錄
+        self.flushed_count = 0
+        self.dead_letter_count = 0
+
+    def append(self, row: Sequence) -> int:
+        """寫入一筆待寫入的資料列（依 insert_sql 的參數順序），回傳日誌序號"""
+        cursor = self._db.execute(
+            "INSERT INTO journal (payload, created) VALUES (?, ?)",
+            (json.dumps(list(row), default=_encode, ensure_ascii=False), time.time())
+        )
+        self._appended += 1
+        if self._wakeup is not None and self._appended >= self.batch_size:
+            self._wakeup.set()
+        return cursor.lastrowid
+
+    def pending(self) -> int:
+        """尚未寫入資料庫的筆數"""
+        return self._db.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def dead_letters(self) -> int:
+        """無法寫入而移到 dead_letter 的筆數"""
+        return self._db.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    async def flush(self) -> int:
+        """把日誌中的記錄批次寫入資料庫，回傳寫入筆數"""
+        async with self._flush_lock:
+            total = 0
+            self._appended = 0
+            while True:
+                batch = self._db.execute(
+                    "SELECT seq, payload FROM journal ORDER BY seq LIMIT ?", (self.batch_size,)
+                ).fetchall()
+                if not batch:
+                    return total
+
+                total += await self._write(batch)
+
+    async def _write(self, batch: List[Tuple[int, str]]) -> int:
+        """寫入一段連續的日誌記錄；資料錯誤時二分找出有問題的記錄，回傳寫入筆數"""
+        rows = [tuple(json.loads(payload, object_hook=_decode)) for _, payload in batch]
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.executemany(self.insert_sql, rows)
+        except DATA_ERRORS as e:
+            if len(batch) == 1:
+                self._dead_letter(batch[0][0], e)
+                return 0
+            middle = len(batch) // 2
+            return await self._write(batch[:middle]) + await self._write(batch[middle:])
+
+        # 資料庫提交成功後才刪除；若在此之前中斷，重啟後會重播（至少寫入一次）
+        self._db.execute("DELETE FROM journal WHERE seq BETWEEN ? AND ?", (batch[0][0], batch[-1][0]))
+        self.flushed_count += len(rows)
+        return len(rows)
+
+    def _dead_letter(self, seq: int, error: Exception):
+        """把無法寫入的記錄從日誌移到 dead_letter，讓後續記錄繼續寫入"""
+        logger.error(f"日誌記錄 {seq} 無法寫入資料庫，移到 dead_letter: {error}")
+        self._db.execute("BEGIN")
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO dead_letter (seq, payload, error, created, failed) "
+                "SELECT seq, payload, ?, created, ? FROM journal WHERE seq = ?",
+                (f"{type(error).__name__}: {error}", time.time(), seq)
+            )
+            self._db.execute("DELETE FROM journal WHERE seq = ?", (seq,))
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        self.dead_letter_count += 1
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"日誌寫入資料庫失敗，{self.retry_delay} 秒後重試（待寫入 {self.pending()} 筆）: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    async def start(self):
+        """啟動背景 flusher（會先重播上次未寫入的記錄）"""
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        pending = self.pending()
+        if pending:
+            logger.info(f"重播上次未寫入的 {pending} 筆 LINE 訊息")
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """停止 flusher 並做最後一次寫入"""
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"關閉時寫入失敗，{self.pending()} 筆保留在日誌待下次重播: {e}")
+
+    def attach(self, app):
+        """掛到 FastAPI：啟動時開始寫入；關閉時排在最前面，確保在連線池關閉前完成最後寫入"""
+        app.add_event_handler("startup", self.start)
+        app.router.on_shutdown.insert(0, self.close)
+        return self
+
+
+def default_journal_path(bot_file: str) -> str:
+    """日誌檔放在 Bot 檔案旁邊"""
+    return os.path.join(os.path.dirname(os.path.abspath(bot_file)), "line_message_journal.db")
@@ -0,0 +1,136 @@
+"""
+LINE Webhook 事件去重
+LINE 在逾時時會重送 webhook（同一個 webhookEventId），若不去重，同一筆叫氣訂單會被處理、寫入兩次。
+記憶體中以有上限、依時間視窗過期的 seen-set 在 O(1) 內擋下重複事件；
+可選擇搭配資料表 line_webhook_events，讓重啟後或多個 Bot 程序之間也能去重。
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookDeduplicator:
+    """webhookEventId 去重"""
+
+    def __init__(self, window: float = 3600.0, max_entries: int = 100000, pool=None,
+                 table: str = "line_webhook_events", retention: float = 86400.0):
+        self.window = window  # 記憶體保留秒數
+        self.max_entries = max_entries  # 記憶體上限，超過時淘汰最舊的 ID
+        self.pool = pool  # line_bot_db_pool.LineBotPool，None 表示只用記憶體
+        self.table = table
+        self.retention = retention  # 資料表保留秒數
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._prune_task: Optional[asyncio.Task] = None
+        self.duplicate_count = 0
+
+    def _evict(self, now: float):
+        # 依加入順序排列，最舊的在最前面
+        while self._seen:
+            event_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.window and len(self._seen) < self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def check_and_mark(self, event_id: str) -> bool:
+        """只檢查記憶體：已見過回傳 True，否則記錄並回傳 False"""
+        now = time.monotonic()
+        self._evict(now)
+        if event_id in self._seen:
+            return True
+        self._seen[event_id] = now
+        return False
+
+    async def _mark_persistent(self, event_ids: List[str]) -> set:
+        """寫入資料表，回傳這次才新加入的 ID（已存在的即為重複）"""
+        rows = await self.pool.fetch(f"""
+            INSERT INTO "{self.table}" ("eventId")
+            SELECT unnest($1::text[])
+            ON CONFLICT ("eventId") DO NOTHING
+            RETURNING "eventId"
+        """, event_ids)
+        return {row["eventId"] for row in rows}
+
+    async def filter_events(self, events: List[Dict]) -> List[Dict]:
+        """過濾掉重複事件（沒有 webhookEventId 的事件一律保留）"""
+        fresh = []
+        for event in events:
+            event_id = event.get("webhookEventId")
+            if event_id and self.check_and_mark(event_id):
+                self.duplicate_count += 1
+                logger.info(f"略過重複事件: {event_id}")
+                continue
+            fresh.append(event)
+
+        event_ids = [event["webhookEventId"] for event in fresh if event.get("webhookEventId")]
+        if self.pool is None or not event_ids:
+            return fresh
+
+        try:
+            inserted = await self._mark_persistent(event_ids)
+        except Exception as e:
+            # 資料表無法使用時只靠記憶體去重，不擋住正常訊息
+            logger.warning(f"去重資料表寫入失敗，僅使用記憶體去重: {e}")
+            return fresh
+
+        result = []
+        for event in fresh:
+            event_id = event.get("webhookEventId")
+            if event_id and event_id not in inserted:
+                self.duplicate_count += 1
+                logger.info(f"略過重複事件（資料表）: {event_id}")
+                continue
+            result.append(event)
+        return result
+
+    async def ensure_table(self):
+        await self.pool.execute(f"""
+            CREATE TABLE IF NOT EXISTS "{self.table}" (
+                "eventId" TEXT PRIMARY KEY,
+                "receivedAt" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await self.pool.execute(f"""
+            CREATE INDEX IF NOT EXISTS "idx_{self.table}_receivedAt" ON "{self.table}" ("receivedAt")
+        """)
+
+    async def prune(self) -> str:
+        """刪除超過保留期限的資料表記錄"""
+        return await self.pool.execute(f"""
+            DELETE FROM "{self.table}"
+            WHERE "receivedAt" < CURRENT_TIMESTAMP - make_interval(secs => $1)
+        """, self.retention)
+
+    async def _prune_loop(self):
+        while True:
+            await asyncio.sleep(self.window)
+            try:
+                await self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"清理去重資料表失敗: {e}")
+
+    async def start(self):
+        if self.pool is None or self._prune_task is not None:
+            return
+        await self.pool.open()
+        await self.ensure_table()
+        self._prune_task = asyncio.create_task(self._prune_loop())
+
+    async def close(self):
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+            self._prune_task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self._seen), "duplicates": self.duplicate_count}
+
+    def attach(self, app):
+        """掛到 FastAPI 的 startup/shutdown 事件"""
+        app.add_event_handler("startup", self.start)
+        app.add_event_handler("shutdown", self.close)
+        return self
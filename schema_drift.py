@@ -0,0 +1,394 @@
+"""
+Prisma 結構漂移偵測
+解析 prisma/schema.prisma 的 model（欄位、@id / @unique / @@index / @@unique / @relation / @map），
+與 db_audit 一次載入的資料庫目錄比對，產生最小的遷移計畫：
+資料表 / 欄位改名（camelCase、snake_case、小寫之間的漂移）、補欄位、型別與 NULL 差異、缺少的索引、唯一鍵與外鍵。
+"""
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from db_audit import _concurrently, get_database_connection, load_catalog
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prisma", "schema.prisma")
+
+# Prisma 純量型別 -> PostgreSQL 型別（未指定 @db 時）
+SCALAR_TYPES = {
+    "String": "text",
+    "Int": "integer",
+    "BigInt": "bigint",
+    "Float": "double precision",
+    "Decimal": "numeric(65,30)",
+    "Boolean": "boolean",
+    "DateTime": "timestamp(3) without time zone",
+    "Json": "jsonb",
+    "Bytes": "bytea",
+}
+
+NATIVE_TYPES = {
+    "VarChar": "character varying",
+    "Char": "character",
+    "Text": "text",
+    "Decimal": "numeric",
+    "Timestamp": "timestamp without time zone",
+    "Timestamptz": "timestamp with time zone",
+    "Date": "date",
+    "Integer": "integer",
+    "SmallInt": "smallint",
+    "Uuid": "uuid",
+    "JsonB": "jsonb",
+}
+
+# 比對型別時視為相容的家族
+TYPE_FAMILIES = {
+    "text": ("text", "character varying"),
+    "character varying": ("character varying", "text"),
+    "timestamp": ("timestamp",),
+    "numeric": ("numeric",),
+}
+
+# 依複雜度排序的計畫步驟
+STEP_ORDER = ["rename_table", "create_table", "rename_column", "add_column", "alter_type",
+              "alter_nullability", "create_index", "add_foreign_key"]
+
+
+def _split_args(text: str) -> List[str]:
+    """以最外層逗號分割"""
+    parts, depth, current = [], 0, ""
+    for ch in text:
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _field_list(text: str) -> List[str]:
+    """[userId, timestamp(sort: Desc)] -> ["userId", "timestamp"]（排序方向見 _sort_orders）"""
+    match = re.search(r"\[([^\]]*)\]", text)
+    if not match:
+        return []
+    return [re.sub(r"\(.*\)", "", item).strip() for item in _split_args(match.group(1))]
+
+
+def _sort_orders(text: str) -> List[str]:
+    """[userId, timestamp(sort: Desc)] -> ["", " DESC"]"""
+    match = re.search(r"\[([^\]]*)\]", text)
+    if not match:
+        return []
+    return [" DESC" if re.search(r"sort\s*:\s*Desc", item) else "" for item in _split_args(match.group(1))]
+
+
+def _named_arg(text: str, name: str) -> Optional[str]:
+    match = re.search(name + r'\s*:\s*"([^"]+)"', text)
+    return match.group(1) if match else None
+
+
+def _attribute_args(attributes: str, name: str) -> Optional[str]:
+    """取出 @name(...) 的參數字串（處理巢狀括號）"""
+    start = attributes.find(name + "(")
+    if start < 0:
+        return None
+    index = start + len(name) + 1
+    depth = 1
+    for position in range(index, len(attributes)):
+        if attributes[position] == "(":
+            depth += 1
+        elif attributes[position] == ")":
+            depth -= 1
+            if depth == 0:
+                return attributes[index:position]
+    return attributes[index:]
+
+
+def parse_prisma_schema(path: str = SCHEMA_PATH) -> Dict[str, Dict]:
+    """解析 schema.prisma，回傳 {model 名稱: model 定義}"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    blocks = re.findall(r"^(model|enum)\s+(\w+)\s*\{(.*?)^\}", text, re.S | re.M)
+    enums = {name for kind, name, _ in blocks if kind == "enum"}
+    model_names = {name for kind, name, _ in blocks if kind == "model"}
+
+    models = {}
+    for kind, name, body in blocks:
+        if kind != "model":
+            continue
+        model = {"name": name, "table": name, "fields": [], "id": [], "indexes": [], "uniques": [],
+                 "foreignKeys": []}
+        for raw in body.splitlines():
+            line = raw.split("//")[0].strip()
+            if not line:
+                continue
+            if line.startswith("@@"):
+                args = _attribute_args(line, line.split("(")[0])
+                if line.startswith("@@map"):
+                    model["table"] = re.search(r'"([^"]+)"', line).group(1)
+                elif line.startswith("@@index"):
+                    model["indexes"].append({"fields": _field_list(args), "orders": _sort_orders(args),
+                                             "name": _named_arg(args, "map")})
+                elif line.startswith("@@unique"):
+                    model["uniques"].append({"fields": _field_list(args), "name": _named_arg(args, "map")})
+                elif line.startswith("@@id"):
+                    model["id"] = _field_list(args)
+                continue
+
+            match = re.match(r"(\w+)\s+(\w+)(\[\])?(\?)?\s*(.*)$", line)
+            if not match:
+                continue
+            field_name, field_type, is_list, optional, attributes = match.groups()
+
+            if field_type in model_names:
+                relation = _attribute_args(attributes, "@relation")
+                if relation and "fields:" in relation:
+                    model["foreignKeys"].append({
+                        "fields": _field_list(relation.split("fields:")[1]),
+                        "references": _field_list(relation.split("references:")[1]),
+                        "model": field_type,
+                        "onDelete": re.search(r"onDelete:\s*(\w+)", relation).group(1)
+                        if "onDelete:" in relation else None,
+                    })
+                continue
+
+            mapped = _attribute_args(attributes, "@map")
+            field = {
+                "name": field_name,
+                "column": mapped.strip('"') if mapped else field_name,
+                "prismaType": field_type,
+                "nullable": bool(optional),
+                "list": bool(is_list),
+                "type": _column_type(field_type, attributes, enums, bool(is_list)),
+                "default": _attribute_args(attributes, "@default"),
+            }
+            model["fields"].append(field)
+            if re.search(r"@id\b", attributes):
+                model["id"] = [field_name]
+            if re.search(r"@unique\b", attributes):
+                model["uniques"].append({"fields": [field_name], "name": None})
+        models[name] = model
+
+    # 外鍵參照的資料表名稱要等所有 @@map 解析完
+    for model in models.values():
+        columns = {field["name"]: field["column"] for field in model["fields"]}
+        for index in model["indexes"] + model["uniques"]:
+            index["columns"] = [columns.get(item, item) for item in index["fields"]]
+        model["idColumns"] = [columns.get(item, item) for item in model["id"]]
+        for foreign_key in model["foreignKeys"]:
+            target = models[foreign_key["model"]]
+            target_columns = {field["name"]: field["column"] for field in target["fields"]}
+            foreign_key["columns"] = [columns.get(item, item) for item in foreign_key["fields"]]
+            foreign_key["referencedTable"] = target["table"]
+            foreign_key["referencedColumns"] = [target_columns.get(item, item) for item in foreign_key["references"]]
+    return models
+
+
+def _column_type(prisma_type: str, attributes: str, enums, is_list: bool) -> str:
+    native = re.search(r"@db\.(\w+)(\(([^)]*)\))?", attributes)
+    if native and native.group(1) in NATIVE_TYPES:
+        base = NATIVE_TYPES[native.group(1)]
+        if native.group(3):
+            args = native.group(3).replace(" ", "")
+            base = base.replace(" without", f"({args}) without").replace(" with ", f"({args}) with ") \
+                if base.startswith("timestamp") else f"{base}({args})"
+    elif prisma_type in enums:
+        base = f'"{prisma_type}"'
+    else:
+        base = SCALAR_TYPES.get(prisma_type, "text")
+    return base + "[]" if is_list else base
+
+
+def _type_family(data_type: str) -> str:
+    for prefix in ("timestamp", "numeric", "character varying", "character"):
+        if data_type.startswith(prefix):
+            return prefix
+    return data_type
+
+
+def _types_compatible(expected: str, actual: str) -> bool:
+    expected_family, actual_family = _type_family(expected), _type_family(actual)
+    if expected_family == "timestamp" and actual_family == "timestamp":
+        # with / without time zone 不同才算漂移
+        return ("with time zone" in expected) == ("with time zone" in actual)
+    return actual_family in TYPE_FAMILIES.get(expected_family, (expected_family,))
+
+
+def _variants(name: str) -> List[str]:
+    """camelCase 欄位在漂移後可能出現的名稱"""
+    snake = re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+    return [candidate for candidate in dict.fromkeys([snake, name.lower()]) if candidate != name]
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _has_index(catalog_indexes: List[Dict], columns: List[str], unique: bool) -> bool:
+    """已有相同前導欄位的索引（唯一鍵需欄位完全相同且為 UNIQUE）"""
+    for index in catalog_indexes:
+        if index["partial"] or not index["valid"]:
+            continue
+        if unique:
+            if index["unique"] and sorted(index["columns"]) == sorted(columns):
+                return True
+        elif index["columns"][:len(columns)] == columns:
+            return True
+    return False
+
+
+def diff_schema(models: Dict[str, Dict], catalog) -> List[Dict]:
+    """比對 Prisma model 與資料庫目錄，回傳遷移步驟"""
+    steps = []
+
+    def step(kind: str, table: str, detail: str, sql: str, safe: bool = True):
+        steps.append({"step": kind, "table": table, "detail": detail, "sql": sql, "safe": safe})
+
+    for model in models.values():
+        table = model["table"]
+        actual_table = table
+        if not catalog.has_table(table):
+            drifted = next((name for name in _variants(table) if catalog.has_table(name)), None)
+            if drifted:
+                step("rename_table", table, f"資料表 {drifted} 應為 {table}",
+                     f"ALTER TABLE {_quote(drifted)} RENAME TO {_quote(table)};")
+                actual_table = drifted
+            else:
+                columns = [f"    {_quote(field['column'])} {field['type']}{'' if field['nullable'] else ' NOT NULL'}"
+                           for field in model["fields"]]
+                if model["idColumns"]:
+                    columns.append(f"    CONSTRAINT {_quote(table + '_pkey')} PRIMARY KEY "
+                                   f"({', '.join(_quote(column) for column in model['idColumns'])})")
+                step("create_table", table, "資料表不存在",
+                     f"CREATE TABLE {_quote(table)} (\n" + ",\n".join(columns) + "\n);")
+                actual_table = None
+
+        actual_columns = {column["name"]: column for column in catalog.columns.get(actual_table, [])} \
+            if actual_table else {}
+        renamed = {}  # 漂移欄位 -> 改名後的欄位，讓既有索引與外鍵在改名後仍算數
+
+        if actual_table:
+            for field in model["fields"]:
+                column = field["column"]
+                current = actual_columns.get(column)
+                if current is None:
+                    drifted = next((name for name in _variants(column) if name in actual_columns), None)
+                    if drifted:
+                        step("rename_column", table, f"欄位 {drifted} 應為 {column}",
+                             f"ALTER TABLE {_quote(table)} RENAME COLUMN {_quote(drifted)} TO {_quote(column)};")
+                        current = actual_columns[drifted]
+                        renamed[drifted] = column
+                    else:
+                        null_sql = "" if field["nullable"] else " NOT NULL"
+                        # 必填欄位在已有資料的表上需要預設值，交由人工確認
+                        step("add_column", table, f"缺少欄位 {column}",
+                             f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(column)} {field['type']}{null_sql};",
+                             safe=field["nullable"] or catalog.tables[actual_table]["rows"] == 0)
+                        continue
+
+                if not _types_compatible(field["type"], current["type"]):
+                    step("alter_type", table, f"欄位 {column} 型別為 {current['type']}，應為 {field['type']}",
+                         f"ALTER TABLE {_quote(table)} ALTER COLUMN {_quote(column)} TYPE {field['type']} "
+                         f"USING {_quote(column)}::{field['type']};", safe=False)
+                if current["notNull"] == field["nullable"]:
+                    action = "DROP NOT NULL" if field["nullable"] else "SET NOT NULL"
+                    step("alter_nullability", table, f"欄位 {column} 應{'可' if field['nullable'] else '不可'}為 NULL",
+                         f"ALTER TABLE {_quote(table)} ALTER COLUMN {_quote(column)} {action};",
+                         safe=field["nullable"])
+
+        catalog_indexes = [dict(index, columns=[renamed.get(column, column) for column in index["columns"]])
+                           for index in catalog.indexes.get(actual_table, [])] if actual_table else []
+        # 新建的資料表沒有並行寫入；分割表的父表不支援 CONCURRENTLY
+        concurrently = _concurrently(catalog, actual_table) if actual_table else ""
+        for index in model["indexes"]:
+            if not _has_index(catalog_indexes, index["columns"], unique=False):
+                name = index["name"] or f"{table}_{'_'.join(index['fields'])}_idx"
+                step("create_index", table, f"缺少 @@index([{', '.join(index['fields'])}])",
+                     f"CREATE INDEX {concurrently}IF NOT EXISTS {_quote(name)} ON {_quote(table)} "
+                     f"({', '.join(_quote(column) + order for column, order in zip(index['columns'], index['orders']))});")
+        for unique in model["uniques"]:
+            if not _has_index(catalog_indexes, unique["columns"], unique=True):
+                name = unique["name"] or f"{table}_{'_'.join(unique['fields'])}_key"
+                step("create_index", table, f"缺少 @unique({', '.join(unique['fields'])})",
+                     f"CREATE UNIQUE INDEX {concurrently}IF NOT EXISTS {_quote(name)} ON {_quote(table)} "
+                     f"({', '.join(_quote(column) for column in unique['columns'])});", safe=False)
+
+        catalog_foreign_keys = [[renamed.get(column, column) for column in constraint["columns"]]
+                                for constraint in catalog.constraints.get(actual_table, [])
+                                if constraint["type"] == "f"] if actual_table else []
+        for foreign_key in model["foreignKeys"]:
+            if foreign_key["columns"] in catalog_foreign_keys:
+                continue
+            name = f"{table}_{'_'.join(foreign_key['fields'])}_fkey"
+            on_delete = {"Cascade": " ON DELETE CASCADE", "SetNull": " ON DELETE SET NULL",
+                         "Restrict": " ON DELETE RESTRICT"}.get(foreign_key["onDelete"], "")
+            # NOT VALID 避免長時間鎖表，確認後再 VALIDATE CONSTRAINT
+            step("add_foreign_key", table, f"缺少外鍵 {', '.join(foreign_key['fields'])} -> "
+                                           f"{foreign_key['referencedTable']}",
+                 f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(name)} FOREIGN KEY "
+                 f"({', '.join(_quote(column) for column in foreign_key['columns'])}) "
+                 f"REFERENCES {_quote(foreign_key['referencedTable'])} "
+                 f"({', '.join(_quote(column) for column in foreign_key['referencedColumns'])}){on_delete} NOT VALID;")
+
+    steps.sort(key=lambda item: STEP_ORDER.index(item["step"]))
+    return steps
+
+
+def render_plan(steps: List[Dict]) -> str:
+    """輸出可執行的 SQL 計畫（CONCURRENTLY 需逐句在交易外執行）"""
+    lines = ["-- 由 schema_drift.py 產生的遷移計畫", ""]
+    for item in steps:
+        prefix = "" if item["safe"] else "-- [需人工確認] "
+        lines.append(f"-- {item['table']}: {item['detail']}")
+        lines.extend(prefix + line if prefix else line for line in item["sql"].splitlines())
+        lines.append("")
+    return "\n".join(lines)
+
+
+def detect_drift(schema_path: str = SCHEMA_PATH):
+    models = parse_prisma_schema(schema_path)
+    conn = get_database_connection()
+    try:
+        catalog = load_catalog(conn, probes={})
+    finally:
+        conn.close()
+    return models, diff_schema(models, catalog)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prisma 結構漂移偵測")
+    parser.add_argument("--schema", default=SCHEMA_PATH, help="schema.prisma 路徑")
+    parser.add_argument("--sql", dest="sql_path", help="輸出 SQL 遷移計畫的路徑")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出計畫")
+
+    args = parser.parse_args()
+    models, steps = detect_drift(args.schema)
+
+    if args.json:
+        print(json.dumps(steps, ensure_ascii=False, indent=2))
+    else:
+        print("=" * 60)
+        print(f"Prisma 結構漂移偵測（{len(models)} 個 model）")
+        print("=" * 60)
+        counts = {}
+        for item in steps:
+            counts[item["step"]] = counts.get(item["step"], 0) + 1
+            mark = "✓" if item["safe"] else "⚠️"
+            print(f"{mark} [{item['table']}] {item['detail']}")
+        if not steps:
+            print("✅ 資料庫與 schema.prisma 一致")
+        else:
+            print("\n📊 " + "、".join(f"{kind} {count}" for kind, count in counts.items()))
+
+    if args.sql_path:
+        with open(args.sql_path, "w", encoding="utf-8") as f:
+            f.write(render_plan(steps))
+        print(f"📄 遷移計畫已寫入 {args.sql_path}")
@@ -1,45 +1,36 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 import re
+import sys
 
-# Read the file
-with open('/root/媽媽ios/app/api/webhook/line/route.ts', 'r', encoding='utf-8') as f:
-    content = f.read()
+# KEYWORD_TRIGGERS / containsTriggerKeyword are generated from line_keyword_triggers.json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from line_keyword_router import KeywordRouter
 
-# Add keyword triggers after the GROUP_PERMISSIONS definition
-keyword_config = '''
-// 關鍵字觸發配置 - 只有包含這些關鍵字的訊息才會回覆
-const KEYWORD_TRIGGERS = [
-  '瓦斯', '訂瓦斯', '買瓦斯', '要瓦斯', '瓦斯桶', '桶',
-  '4kg', '10kg', '16kg', '20kg', '50kg', '公斤',
-  '訂單', '查訂單', '我的訂單', '訂購', '下單',
-  '價格', '多少錢', '價錢', '費用',
-  '庫存', '還有多少', '有沒有貨',
-  '聯絡', '聯繫', '電話', '地址', '營業',
-  '你好', '您好', '嗨', 'hi', 'hello',
-  '幫助', '說明', '怎麼用', '?',
-  '任務', '報表', '營收', '業績',
-  '綁定', '會員', '我是新',
-]
+ROUTE_PATH = sys.argv[1] if len(sys.argv) > 1 else '/root/媽媽ios/app/api/webhook/line/route.ts'
+BEGIN_MARKER = '// <keyword-triggers>'
+END_MARKER = '// </keyword-triggers>'
 
-function containsTriggerKeyword(message: string): boolean {
-  const lower = message.toLowerCase().trim()
-  for (const kw of KEYWORD_TRIGGERS) {
-    if (lower.includes(kw.toLowerCase())) return true
-  }
-  if (message.startsWith('/') || message.startsWith('！')) return true
-  return false
-}
+# Read the file
+with open(ROUTE_PATH, 'r', encoding='utf-8') as f:
+    content = f.read()
 
-'''
+keyword_config = '\n' + BEGIN_MARKER + KeywordRouter.from_config().render_typescript() + END_MARKER + '\n'
 
-# Find where to insert - after GROUP_PERMISSIONS closing brace
-pattern = r"(GENERAL:.*?features.*?\[\]},)"
-match = re.search(pattern, content, re.DOTALL)
-if match:
-    insert_pos = match.end()
-    content = content[:insert_pos] + keyword_config + content[insert_pos:]
-    print("Added keyword config after GROUP_PERMISSIONS")
+# Re-running the script replaces the previously generated block
+block = re.compile(re.escape('\n' + BEGIN_MARKER) + r'.*?' + re.escape(END_MARKER + '\n'), re.DOTALL)
+if block.search(content):
+    content = block.sub(lambda _: keyword_config, content)
+    print("Regenerated keyword config")
+else:
+    # Add keyword triggers after the GROUP_PERMISSIONS definition
+    pattern = r"(GENERAL:.*?features.*?\[\]},)"
+    match = re.search(pattern, content, re.DOTALL)
+    if match:
+        insert_pos = match.end()
+        content = content[:insert_pos] + keyword_config + content[insert_pos:]
+        print("Added keyword config after GROUP_PERMISSIONS")
 
 # Now add the keyword check in the message handler
 old_code = '''        const userMessage = event.message.text.trim()
@@ -66,11 +57,11 @@ new_code = '''        const userMessage = event.message.text.trim()
 if old_code in content:
     content = content.replace(old_code, new_code)
     print("Added keyword filter in message handler")
-else:
+elif 'containsTriggerKeyword(userMessage)' not in content:
     print("Warning: Could not find message handler pattern")
 
 # Write back
-with open('/root/媽媽ios/app/api/webhook/line/route.ts', 'w', encoding='utf-8') as f:
+with open(ROUTE_PATH, 'w', encoding='utf-8') as f:
     f.write(content)
 
 print("Done!")
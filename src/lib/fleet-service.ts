@@ -38,6 +38,22 @@ export async function updateDriverLocation(input: DriverLocationInput) {
     },
   });
 
+  // 同步更新最新位置表，派車地圖不必再掃描歷史軌跡
+  const latest = {
+    latitude: location.latitude,
+    longitude: location.longitude,
+    accuracy: location.accuracy,
+    speed: location.speed,
+    heading: location.heading,
+    recordedAt: location.createdAt,
+    seenAt: location.createdAt,
+  };
+  await prisma.driverLatestLocation.upsert({
+    where: { driverId: input.driverId },
+    create: { driverId: input.driverId, address: location.address, ...latest },
+    update: location.address ? { address: location.address, ...latest } : latest,
+  });
+
   // 清理舊的位置記錄（只保留最近 7 天）
   const weekAgo = new Date();
   weekAgo.setDate(weekAgo.getDate() - 7);
@@ -56,6 +72,7 @@ export async function updateDriverLocation(input: DriverLocationInput) {
  * 獲取司機最新位置
  */
 export async function getDriverLatestLocation(driverId: string) {
+  // 維持原本回傳的 DriverLocation 欄位；(driverId, createdAt) 索引讓這個查詢只讀一筆
   return prisma.driverLocation.findFirst({
     where: { driverId },
     orderBy: { createdAt: 'desc' },
@@ -68,20 +85,23 @@ export async function getDriverLatestLocation(driverId: string) {
 export async function getAllDriverLocations() {
   const drivers = await prisma.user.findMany({
     where: { role: 'driver', isActive: true },
-    select: { id: true, name: true, phone: true },
+    select: { id: true, name: true, phone: true, latestLocation: true },
   });
 
-  const locations = await Promise.all(
-    drivers.map(async (driver) => {
-      const location = await getDriverLatestLocation(driver.id);
-      return {
-        ...driver,
-        location,
-      };
-    })
-  );
-
-  return locations;
+  // 以 DriverLocation 的欄位名稱回傳（最新位置表不保存 id / note）
+  return drivers.map(({ latestLocation, ...driver }) => ({
+    ...driver,
+    location: latestLocation && {
+      driverId: latestLocation.driverId,
+      latitude: latestLocation.latitude,
+      longitude: latestLocation.longitude,
+      accuracy: latestLocation.accuracy,
+      speed: latestLocation.speed,
+      heading: latestLocation.heading,
+      address: latestLocation.address,
+      createdAt: latestLocation.recordedAt,
+    },
+  }));
 }
 
 /**